@@ -28,98 +28,208 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-import sre_compile
+import bisect
+import functools
+import re
+
+# Characters FindEndOfExpressionInLine reacts to; everything else is skipped.
+_BRACKETS_RE = re.compile(r'[()\[\]{}<>;]')
+
+# Characters CloseExpression can start from.
+_OPENING_CHARS = '({[<'
+
+# Byte codes of the characters matched by _BRACKETS_RE.  The bracket index and
+# the expression stack hold these rather than one-character strings.
+_OPEN_PAREN = ord('(')
+_CLOSE_PAREN = ord(')')
+_OPEN_BRACKET = ord('[')
+_CLOSE_BRACKET = ord(']')
+_OPEN_BRACE = ord('{')
+_CLOSE_BRACE = ord('}')
+_OPEN_ANGLE = ord('<')
+
+# Opening byte code matching each closing one.
+_OPENING = bytearray(128)
+_OPENING[_CLOSE_PAREN] = _OPEN_PAREN
+_OPENING[_CLOSE_BRACKET] = _OPEN_BRACKET
+_OPENING[_CLOSE_BRACE] = _OPEN_BRACE
+
+# Categories of the characters matched by _BRACKETS_RE, indexed by byte code.
+_OPEN = 1
+_CLOSE = 2
+_LESS = 3
+_GREATER = 4
+_SEMICOLON = 5
+_CATEGORY = bytearray(128)
+for _chars, _category in [('([{', _OPEN), (')]}', _CLOSE), ('<', _LESS),
+                          ('>', _GREATER), (';', _SEMICOLON)]:
+    for _char in _chars:
+        _CATEGORY[ord(_char)] = _category
+del _chars, _category, _char
+
+# Loop header pattern checked on every line by CheckLoopCondition.
+_MATCH_LOOP_HEADER = re.compile(r'\s*(for|while)\s*\(').match
+
+
+def _EndsWithOperator(line, end):
+    r"""Checks whether line[0:end] ends with the 'operator' keyword.
+
+    This is equivalent to re.search(r'\boperator\s*$', line[0:end]), but looks
+    at the tail of the line in place instead of copying the prefix and
+    running a regexp over it.
+
+    Args:
+      line: a CleansedLines line.
+      end: end of the prefix to check, exclusive.
+
+    Returns:
+      True if the prefix ends with 'operator' followed by optional spaces.
+    """
+    while end > 0 and line[end - 1].isspace():
+        end -= 1
+    if not line.endswith('operator', 0, end):
+        return False
+    start = end - len('operator')
+    return start == 0 or not (line[start - 1].isalnum() or line[start - 1] == '_')
+
+
+def _IsOperatorAngle(line, i, is_open):
+    """Checks whether the angle bracket at line[i] is part of an operator.
+
+    Args:
+      line: a CleansedLines line.
+      i: position of the '<' or '>' in line.
+      is_open: True for '<', False for '>'.
+
+    Returns:
+      True if the bracket cannot open or close a template argument list:
+      a '<' right after the 'operator' keyword, or a '>' that follows '-'
+      or whose preceding character follows the keyword, as in "operator>>".
+    """
+    if i == 0:
+        return False
+    if is_open:
+        return _EndsWithOperator(line, i)
+    return line[i - 1] == '-' or _EndsWithOperator(line, i - 1)
+
+
+def _FindBrackets(line):
+    """Indexes the bracket characters of a line.
+
+    Args:
+      line: a CleansedLines line.
+
+    Returns:
+      A (positions, tokens) pair: the sorted list of positions of the bracket
+      characters in line, and a bytes object of their byte codes in the same
+      order.
+    """
+    matches = list(_BRACKETS_RE.finditer(line))
+    return ([m.start() for m in matches],
+            ''.join([m.group() for m in matches]).encode('ascii'))
 
-_regexp_compile_cache = {}
 
+def _LineBrackets(clean_lines, linenum):
+    """Returns the bracket index of a line, building it on first use.
 
-def Match(pattern, s):
-    """Matches the string with the pattern, caching the compiled regexp."""
-    # The regexp compilation caching is inlined in both Match and Search for
-    # performance reasons; factoring it out into a separate function turns out
-    # to be noticeably expensive.
-    if pattern not in _regexp_compile_cache:
-        _regexp_compile_cache[pattern] = sre_compile.compile(pattern)
-    return _regexp_compile_cache[pattern].match(s)
+    The index is stored on clean_lines, so each line of a file is scanned at
+    most once no matter how many expressions are closed over it.
 
+    Args:
+      clean_lines: A CleansedLines instance containing the file.
+      linenum: The number of the line to index.
 
-def Search(pattern, s):
-    """Searches the string for the pattern, caching the compiled regexp."""
-    if pattern not in _regexp_compile_cache:
-        _regexp_compile_cache[pattern] = sre_compile.compile(pattern)
-    return _regexp_compile_cache[pattern].search(s)
+    Returns:
+      A (positions, tokens) pair, see _FindBrackets.
+    """
+    index = getattr(clean_lines, '_bracket_index', None)
+    if index is None:
+        index = clean_lines._bracket_index = [None] * clean_lines.NumLines()
+    brackets = index[linenum]
+    if brackets is None:
+        brackets = index[linenum] = _FindBrackets(clean_lines.elided[linenum])
+    return brackets
 
 
-def FindEndOfExpressionInLine(line, startpos, stack):
+def FindEndOfExpressionInLine(line, startpos, stack, brackets=None):
     """Find the position just after the end of current parenthesized expression.
 
     Args:
       line: a CleansedLines line.
       startpos: start searching at this position.
-      stack: nesting stack at startpos.
+      stack: nesting stack at startpos, a bytearray of the byte codes of the
+        pending opening characters.
+      brackets: bracket index of line as returned by _FindBrackets, computed
+        here if not given.
 
     Returns:
       On finding matching end: (index just after matching end, None)
       On finding an unclosed expression: (-1, None)
       Otherwise: (-1, new stack at end of this line)
     """
-    for i in range(startpos, len(line)):
-        char = line[i]
-        if char in '([{':
+    if brackets is None:
+        brackets = _FindBrackets(line)
+    (positions, tokens) = brackets
+    first = bisect.bisect_left(positions, startpos)
+    if first == len(positions):
+        # No brackets left on this line
+        return (-1, stack)
+    for k in range(first, len(positions)):
+        i = positions[k]
+        char = tokens[k]
+        category = _CATEGORY[char]
+        if category == _OPEN:
             # Found start of parenthesized expression, push to expression stack
             stack.append(char)
-        elif char == '<':
+        elif category == _LESS:
             # Found potential start of template argument list
             if i > 0 and line[i - 1] == '<':
                 # Left shift operator
-                if stack and stack[-1] == '<':
+                if stack and stack[-1] == _OPEN_ANGLE:
                     stack.pop()
                     if not stack:
                         return (-1, None)
-            elif i > 0 and Search(r'\boperator\s*$', line[0:i]):
+            elif _IsOperatorAngle(line, i, True):
                 # operator<, don't add to stack
                 continue
             else:
                 # Tentative start of template argument list
-                stack.append('<')
-        elif char in ')]}':
+                stack.append(_OPEN_ANGLE)
+        elif category == _CLOSE:
             # Found end of parenthesized expression.
             #
             # If we are currently expecting a matching '>', the pending '<'
             # must have been an operator.  Remove them from expression stack.
-            while stack and stack[-1] == '<':
+            while stack and stack[-1] == _OPEN_ANGLE:
                 stack.pop()
             if not stack:
                 return (-1, None)
-            if ((stack[-1] == '(' and char == ')') or
-                    (stack[-1] == '[' and char == ']') or
-                    (stack[-1] == '{' and char == '}')):
+            if stack[-1] == _OPENING[char]:
                 stack.pop()
                 if not stack:
                     return (i + 1, None)
             else:
                 # Mismatched parentheses
                 return (-1, None)
-        elif char == '>':
+        elif category == _GREATER:
             # Found potential end of template argument list.
 
             # Ignore "->" and operator functions
-            if (i > 0 and
-                    (line[i - 1] == '-' or Search(r'\boperator\s*$', line[0:i - 1]))):
+            if _IsOperatorAngle(line, i, False):
                 continue
 
             # Pop the stack if there is a matching '<'.  Otherwise, ignore
             # this '>' since it must be an operator.
             if stack:
-                if stack[-1] == '<':
+                if stack[-1] == _OPEN_ANGLE:
                     stack.pop()
                     if not stack:
                         return (i + 1, None)
-        elif char == ';':
+        elif category == _SEMICOLON:
             # Found something that look like end of statements.  If we are currently
             # expecting a '>', the matching '<' must have been an operator, since
             # template argument list should not contain statements.
-            while stack and stack[-1] == '<':
+            while stack and stack[-1] == _OPEN_ANGLE:
                 stack.pop()
             if not stack:
                 return (-1, None)
@@ -128,6 +238,37 @@ def FindEndOfExpressionInLine(line, startpos, stack):
     return (-1, stack)
 
 
+def _CloseParenFast(brackets, pos):
+    """Finds the ')' closing the '(' at pos when it is on the same line.
+
+    This is a fast path for FindEndOfExpressionInLine that only counts the
+    nesting depth of parentheses.  While the '(' is at the bottom of the
+    stack, '<', '>' and ';' never change which ')' closes it, so they are
+    skipped.  Square brackets and braces are left to the full matcher.
+
+    Args:
+      brackets: bracket index of the line, as returned by _FindBrackets.
+      pos: position of the '(' in the line.
+
+    Returns:
+      The index just after the matching ')', or -1 if the line holds square
+      brackets or braces or does not close the expression.
+    """
+    (positions, tokens) = brackets
+    depth = 0
+    for k in range(bisect.bisect_left(positions, pos), len(tokens)):
+        char = tokens[k]
+        if char == _OPEN_PAREN:
+            depth += 1
+        elif char == _CLOSE_PAREN:
+            depth -= 1
+            if not depth:
+                return positions[k] + 1
+        elif _CATEGORY[char] in (_OPEN, _CLOSE):
+            return -1
+    return -1
+
+
 def CloseExpression(clean_lines, linenum, pos):
     """If input points to ( or { or [ or <, finds the position that closes it.
 
@@ -137,7 +278,9 @@ def CloseExpression(clean_lines, linenum, pos):
     TODO(unknown): cpplint spends a fair bit of time matching parentheses.
     Ideally we would want to index all opening and closing parentheses once
     and have CloseExpression be just a simple lookup, but due to preprocessor
-    tricks, this is not so easy.
+    tricks, this is not so easy.  As a middle ground, the bracket characters
+    of each line are indexed once (see _LineBrackets) and only those are
+    visited while matching.
 
     Args:
       clean_lines: A CleansedLines instance containing the file.
@@ -152,11 +295,19 @@ def CloseExpression(clean_lines, linenum, pos):
     """
 
     line = clean_lines.elided[linenum]
-    if (line[pos] not in '({[<') or Match(r'<[<=]', line[pos:]):
+    char = line[pos]
+    if (char not in _OPENING_CHARS or
+            (char == '<' and pos + 1 < len(line) and line[pos + 1] in '<=')):
         return (line, clean_lines.NumLines(), -1)
 
-    # Check first line
-    (end_pos, stack) = FindEndOfExpressionInLine(line, pos, [])
+    # Check first line, trying the fast path for parentheses first
+    brackets = _LineBrackets(clean_lines, linenum)
+    if char == '(':
+        end_pos = _CloseParenFast(brackets, pos)
+        if end_pos > -1:
+            return (line, linenum, end_pos)
+    (end_pos, stack) = FindEndOfExpressionInLine(
+        line, pos, bytearray(), brackets)
     if end_pos > -1:
         return (line, linenum, end_pos)
 
@@ -164,7 +315,12 @@ def CloseExpression(clean_lines, linenum, pos):
     while stack and linenum < clean_lines.NumLines() - 1:
         linenum += 1
         line = clean_lines.elided[linenum]
-        (end_pos, stack) = FindEndOfExpressionInLine(line, 0, stack)
+        brackets = _LineBrackets(clean_lines, linenum)
+        if not brackets[0]:
+            # Nothing on this line can change the stack
+            continue
+        (end_pos, stack) = FindEndOfExpressionInLine(
+            line, 0, stack, brackets)
         if end_pos > -1:
             return (line, linenum, end_pos)
 
@@ -172,29 +328,21 @@ def CloseExpression(clean_lines, linenum, pos):
     return (line, clean_lines.NumLines(), -1)
 
 
+# Loop headers repeat a lot, e.g. "i = 0; i < n; ++i", so the result is cached.
+# WhileLoopHelper is not: its 'in' chain is cheaper than a cache lookup.
+@functools.lru_cache(maxsize=4096)
 def ForLoopHelper(stmt):
-    buf = stmt.split(';')
-    found = False
-    ops = ['+', '-', '*', '/', '%', '<<', '>>']
-
-    if len(buf) >= 2:
-        for item in ops:
-            if item in buf[1]:
-                found = True
-
-    return found
+    buf = stmt.split(';', 2)
+    if len(buf) < 2:
+        return False
+    return WhileLoopHelper(buf[1])
 
 
 def WhileLoopHelper(stmt):
-    buf = stmt
-    found = False
-    ops = ['+', '-', '*', '/', '%', '<<', '>>']
-
-    for item in ops:
-        if item in buf:
-            found = True
-
-    return found
+    # Chained 'in' tests stop at the first operator found and allocate
+    # nothing, which beats both any() over a tuple and str.translate.
+    return ('+' in stmt or '-' in stmt or '*' in stmt or '/' in stmt or
+            '%' in stmt or '<<' in stmt or '>>' in stmt)
 
 
 def CheckLoopCondition(filename, clean_lines, linenum, error):
@@ -207,13 +355,12 @@ def CheckLoopCondition(filename, clean_lines, linenum, error):
     """
     line = clean_lines.elided[linenum]
 
-    matched = Match(r'\s*(for|while)\s*\(', line)
+    matched = _MATCH_LOOP_HEADER(line)
     if matched:
         # Find the end of the conditional expression.
-        (end_line, end_linenum, end_pos) = CloseExpression(
-            clean_lines, linenum, line.find('('))
-
         start = line.find('(')
+        (end_line, end_linenum, end_pos) = CloseExpression(
+            clean_lines, linenum, start)
         end = end_pos - 1
 
         if start >= 0 and end >= 0:
@@ -221,9 +368,6 @@ def CheckLoopCondition(filename, clean_lines, linenum, error):
                 if ForLoopHelper(line[start+1:end]) is True:
                     error(filename, end_linenum, 'runtime/for_loop_condition', 5,
                           'Possible incorrect condition in range-based for loop')
-            elif matched.group(1) == 'while':
-                if WhileLoopHelper(line[start+1:end]) is True:
-                    error(filename, end_linenum, 'runtime/while_loop_condition', 5,
-                          'Possible incorrect condition in range-based while loop')
-            else:
-                pass
+            elif WhileLoopHelper(line[start+1:end]) is True:
+                error(filename, end_linenum, 'runtime/while_loop_condition', 5,
+                      'Possible incorrect condition in range-based while loop')
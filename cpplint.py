@@ -54,7 +54,6 @@ import itertools
 import math  # for log
 import os
 import re
-import sre_compile
 import string
 import sys
 import sysconfig
@@ -1043,7 +1042,7 @@ def Match(pattern, s):
   # performance reasons; factoring it out into a separate function turns out
   # to be noticeably expensive.
   if pattern not in _regexp_compile_cache:
-    _regexp_compile_cache[pattern] = sre_compile.compile(pattern)
+    _regexp_compile_cache[pattern] = re.compile(pattern)
   return _regexp_compile_cache[pattern].match(s)
 
 
@@ -1061,14 +1060,14 @@ def ReplaceAll(pattern, rep, s):
     string with replacements made (or original string if no replacements)
   """
   if pattern not in _regexp_compile_cache:
-    _regexp_compile_cache[pattern] = sre_compile.compile(pattern)
+    _regexp_compile_cache[pattern] = re.compile(pattern)
   return _regexp_compile_cache[pattern].sub(rep, s)
 
 
 def Search(pattern, s):
   """Searches the string for the pattern, caching the compiled regexp."""
   if pattern not in _regexp_compile_cache:
-    _regexp_compile_cache[pattern] = sre_compile.compile(pattern)
+    _regexp_compile_cache[pattern] = re.compile(pattern)
   return _regexp_compile_cache[pattern].search(s)
 
 
@@ -2005,6 +2004,11 @@ class CleansedLines(object):
     return collapsed
 
 
+# Matches an 'operator' keyword at the end of the searched range.  Searched with
+# an endpos argument, so the line prefix before a '<' or '>' is not copied.
+_RE_PATTERN_OPERATOR_TAIL = re.compile(r'\boperator\s*$')
+
+
 def FindEndOfExpressionInLine(line, startpos, stack):
   """Find the position just after the end of current parenthesized expression.
 
@@ -2031,7 +2035,7 @@ def FindEndOfExpressionInLine(line, startpos, stack):
           stack.pop()
           if not stack:
             return (-1, None)
-      elif i > 0 and Search(r'\boperator\s*$', line[0:i]):
+      elif i > 0 and _RE_PATTERN_OPERATOR_TAIL.search(line, 0, i):
         # operator<, don't add to stack
         continue
       else:
@@ -2060,7 +2064,8 @@ def FindEndOfExpressionInLine(line, startpos, stack):
 
       # Ignore "->" and operator functions
       if (i > 0 and
-          (line[i - 1] == '-' or Search(r'\boperator\s*$', line[0:i - 1]))):
+          (line[i - 1] == '-' or
+           _RE_PATTERN_OPERATOR_TAIL.search(line, 0, i - 1))):
         continue
 
       # Pop the stack if there is a matching '<'.  Otherwise, ignore
@@ -2156,7 +2161,7 @@ def FindStartOfExpressionInLine(line, endpos, stack):
       if (i > 0 and
           (line[i - 1] == '-' or
            Match(r'\s>=\s', line[i - 1:]) or
-           Search(r'\boperator\s*$', line[0:i]))):
+           _RE_PATTERN_OPERATOR_TAIL.search(line, 0, i))):
         i -= 1
       else:
         stack.append('>')
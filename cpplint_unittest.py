@@ -45,6 +45,7 @@ import unittest
 import pytest
 
 import cpplint
+from checks import loopcheck
 
 try:
   xrange          # Python 2
@@ -6061,6 +6062,75 @@ class CloseExpressionTest(unittest.TestCase):
       self.assertEquals((p[2], p[3]), (line, column))
 
 
+class LoopCheckTest(unittest.TestCase):
+
+  def setUp(self):
+    self.lines = cpplint.CleansedLines(
+        #           1         2         3         4         5
+        # 0123456789012345678901234567890123456789012345678901234567890
+        ['// Line 0',
+         'for (i = 0; i < len - 1; ++i) {',
+         'while (Compare<int>(a, b) && operator<(a, b)) {',
+         'if (p->next != nullptr && x.operator > (y)) {',
+         'for (int i = 0;',
+         '     i < n;',
+         '     i += step(x)) {',
+         'f(a << 1, [&]() { return a; });',
+         '// Line 8',
+         'xoperator<T> x;',
+         'my_operator<T> x;',
+         'operator<T> x;',
+         '  operator <T> x;',
+         'a<b, operator >> c>',
+         'a<b, xoperator >> c>',
+         '// Line 15'])
+    self.errors = []
+
+  def _Error(self, unused_filename, linenum, category, confidence, message):
+    self.errors.append((linenum, category, confidence, message))
+
+  def testCloseExpression(self):
+    # List of positions to test:
+    # (start line, start position, end line, end position + 1)
+    positions = [(1, 4, 1, 29),
+                 (2, 6, 2, 45),
+                 (2, 14, 2, 19),
+                 (2, 19, 2, 25),
+                 (3, 3, 3, 43),
+                 (4, 4, 6, 18),
+                 (6, 14, 6, 17),
+                 (7, 1, 7, 30),
+                 (7, 10, 7, 13),
+                 (7, 16, 7, 29),
+                 (7, 4, 16, -1),  # Left shift operator
+                 (9, 9, 9, 12),  # Not the operator keyword
+                 (10, 11, 10, 14),  # Not the operator keyword
+                 (11, 8, 16, -1),  # operator< at column 0
+                 (12, 11, 16, -1),  # Space before operator's '<'
+                 (13, 1, 13, 19),  # operator>> inside template arguments
+                 (14, 1, 14, 16)]  # Not the operator keyword
+    for p in positions:
+      (_, line, column) = loopcheck.CloseExpression(self.lines, p[0], p[1])
+      self.assertEquals((p[2], p[3]), (line, column))
+
+  def testLoopHelpers(self):
+    self.assertFalse(loopcheck.ForLoopHelper('i = 0; i < len; ++i'))
+    self.assertTrue(loopcheck.ForLoopHelper('i = 0; i < len - 1; ++i'))
+    self.assertTrue(loopcheck.ForLoopHelper('i = 0; i < (n >> 1); ++i'))
+    self.assertFalse(loopcheck.ForLoopHelper('auto& x : v'))
+    self.assertFalse(loopcheck.WhileLoopHelper('i < len'))
+    self.assertTrue(loopcheck.WhileLoopHelper('i < len % 2'))
+    self.assertTrue(loopcheck.WhileLoopHelper('i < 1 << n'))
+
+  def testCheckLoopCondition(self):
+    for i in xrange(self.lines.NumLines()):
+      loopcheck.CheckLoopCondition('foo.cc', self.lines, i, self._Error)
+    self.assertEquals(
+        [(1, 'runtime/for_loop_condition', 5,
+          'Possible incorrect condition in range-based for loop')],
+        self.errors)
+
+
 class NestingStateTest(unittest.TestCase):
 
   def setUp(self):